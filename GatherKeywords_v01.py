@@ -1,38 +1,112 @@
+import json
+import re
+import functools
 import win32com.client
-import pandas as pd
-from collections import defaultdict
+import polars as pl
+import xlsxwriter
 
 # ----------------------------
 # Configuration
 # ----------------------------
-STOPWORDS = {
+STOPWORDS = frozenset({
     "is", "in", "the", "a", "an", "and", "or", "of", "to", "for", "on", "with", "at", "by"
-}
+})
 
 OUTPUT_FILE = r"C:\Temp\subject_keyword_frequency.xlsx"
 
+# "discover" mode (None): propose new keywords from subject phrases.
+# "known" mode: set to the sorter config to count only its rule keywords,
+# e.g. "config_archive_v02.json".
+RULES_CONFIG_FILE = None
+
+# Longest phrase (in words) generated in "discover" mode
+MAX_PHRASE_WORDS = 4
+
+# Reply/forward prefixes and trailing "(2)" / "[3]" counters are stripped so
+# templated subjects share one phrase cache entry
+SUBJECT_PREFIX = re.compile(r"^(?:\s*(?:re|fw|fwd)\s*:)+")
+SUBJECT_COUNTER = re.compile(r"[\[(]\d+[\])]\s*$")
+PHRASE_CACHE_SIZE = 50000
+
+# ----------------------------
+# Known keywords
+# ----------------------------
+def load_known_keywords(config_file):
+    """
+    Read every keyword from the sorter's keyword rule sheets.
+    Email address rules are skipped, same split as the sorter's load_data.
+    """
+    with open(config_file, 'r') as f:
+        config = json.load(f)
+
+    sheet_columns = {}
+    for rule_name, info in config.get('sheet_map', {}).items():
+        if 'Email' in rule_name and 'Keyword' not in rule_name:
+            continue
+        cols = info.get('columns', [info.get('column')])
+        if not cols or cols == [None]:
+            continue
+        sheet_columns.setdefault(info['sheet'], []).extend(cols)
+
+    keywords = set()
+    if not sheet_columns:
+        return keywords
+
+    # One calamine read for all keyword sheets; cells are read as text
+    sheets = pl.read_excel(config['xls_path'], sheet_name=list(sheet_columns),
+                           engine="calamine", infer_schema_length=0)
+    for sheet, cols in sheet_columns.items():
+        for col in cols:
+            for kw in sheets[sheet][col].drop_nulls().unique().to_list():
+                keywords.add(kw.casefold())
+
+    return keywords
+
+def build_keyword_automaton(keywords):
+    """Compile the known keywords once into an Aho-Corasick automaton."""
+    # Only known-keyword mode needs pyahocorasick, discover mode runs without it
+    import ahocorasick
+    automaton = ahocorasick.Automaton()
+    for kw in keywords:
+        automaton.add_word(kw, kw)
+    automaton.make_automaton()
+    return automaton
+
 # ----------------------------
 # Keyword generation
 # ----------------------------
-def generate_phrases_from_subject(subject, stopwords):
+def generate_phrases_from_subject(subject, stopwords, automaton=None):
     """
-    Generate all contiguous phrases from a subject line.
-    - Lowercase only
-    - Whitespace tokenization
+    Generate phrases from a subject line.
+    - Casefolded only, same as the sorter's keyword rules
+    - "RE:"/"FW:" prefixes and a trailing counter are ignored
+    - With an automaton: only the known keywords found in the subject
+    - Otherwise: contiguous phrases of up to MAX_PHRASE_WORDS words,
+      whitespace tokenization
     - Stopwords excluded only for single-word phrases
-    - Each phrase returned once per subject
+    - Each phrase returned once per subject, as a frozenset shared between
+      subjects that normalize to the same text
     """
     if not subject:
-        return set()
+        return frozenset()
+
+    subject = SUBJECT_PREFIX.sub("", subject.casefold())
+    subject = SUBJECT_COUNTER.sub("", subject).strip()
+
+    return _phrases_from_normalized_subject(subject, stopwords, automaton)
+
+@functools.lru_cache(maxsize=PHRASE_CACHE_SIZE)
+def _phrases_from_normalized_subject(subject, stopwords, automaton):
+    if automaton is not None:
+        return frozenset(kw for _, kw in automaton.iter(subject))
 
-    subject = subject.lower()
     words = subject.split()
     n = len(words)
 
     phrases = set()
 
     for i in range(n):
-        for j in range(i + 1, n + 1):
+        for j in range(i + 1, min(i + MAX_PHRASE_WORDS, n) + 1):
             phrase = " ".join(words[i:j])
 
             # Exclude single-word stopwords
@@ -41,7 +115,7 @@ def generate_phrases_from_subject(subject, stopwords):
 
             phrases.add(phrase)
 
-    return phrases
+    return frozenset(phrases)
 
 # ----------------------------
 # Outlook access
@@ -68,40 +142,46 @@ def get_subjects_from_outlook_folder():
 def build_keyword_frequency_table():
     subjects = get_subjects_from_outlook_folder()
 
-    phrase_counts = defaultdict(int)
-
-    for subject in subjects:
-        phrases_in_subject = generate_phrases_from_subject(subject, STOPWORDS)
-
-        # Count each phrase once per email
-        for phrase in phrases_in_subject:
-            phrase_counts[phrase] += 1
+    automaton = None
+    if RULES_CONFIG_FILE:
+        keywords = load_known_keywords(RULES_CONFIG_FILE)
+        if keywords:
+            automaton = build_keyword_automaton(keywords)
 
-    # Convert to DataFrame
-    df = pd.DataFrame(
-        [(count, phrase) for phrase, count in phrase_counts.items()],
-        columns=["Count", "Phrase"]
-    )
+    all_phrases = []
 
-    # Sort: highest count first, then longest phrase (better matching priority)
-    df.sort_values(
-        by=["Count", "Phrase"],
-        ascending=[False, True],
-        inplace=True
+    for subject in subjects:
+        # Each phrase appears once per email, so a flat count is per email
+        all_phrases.extend(generate_phrases_from_subject(subject, STOPWORDS, automaton))
+
+    # Count with a hash group-by over the Arrow string column
+    counts = (
+        pl.DataFrame({"Phrase": all_phrases}, schema={"Phrase": pl.String})
+        .group_by("Phrase")
+        .len(name="Count")
+        # Sort: highest count first, then phrase
+        .sort(["Count", "Phrase"], descending=[True, False])
     )
 
-    return df
+    # (count, phrase) rows, streamed into the export
+    return counts.select("Count", "Phrase").iter_rows()
 
 # ----------------------------
 # Export to Excel
 # ----------------------------
-def export_to_excel(df):
-    df.to_excel(OUTPUT_FILE, index=False)
+def export_to_excel(rows):
+    # constant_memory streams each row to disk; rows must be written in order
+    workbook = xlsxwriter.Workbook(OUTPUT_FILE, {"constant_memory": True})
+    sheet = workbook.add_worksheet()
+    sheet.write_row(0, 0, ["Count", "Phrase"])
+    for row, values in enumerate(rows, start=1):
+        sheet.write_row(row, 0, values)
+    workbook.close()
     print(f"Excel file written to: {OUTPUT_FILE}")
 
 # ----------------------------
 # Run
 # ----------------------------
 if __name__ == "__main__":
-    df = build_keyword_frequency_table()
-    export_to_excel(df)
+    rows = build_keyword_frequency_table()
+    export_to_excel(rows)
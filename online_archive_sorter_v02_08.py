@@ -13,36 +13,113 @@ import os
 import win32com.client
 import pandas as pd
 import datetime
-import openpyxl
+import xlsxwriter
 import tkinter as tk
 from tkinter import messagebox, simpledialog, ttk
 import threading
+from concurrent.futures import ThreadPoolExecutor
 import logging
 import time
 import json
 import re
 import pythoncom
 import sys
+import sqlite3
+
+try:
+    import ahocorasick
+except ImportError:
+    # Keyword rules fall back to an RE2 set, see _build_keyword_index
+    ahocorasick = None
+
+try:
+    import re2
+except ImportError:
+    re2 = None
+
+
+class LazyItem:
+    """A MailItem that is only opened by EntryID once something needs it."""
+
+    def __init__(self, entry_id, store_id=None, namespace=None, item=None):
+        self.entry_id = entry_id
+        self.store_id = store_id
+        self.namespace = namespace
+        self.item = item
+
+    def get(self):
+        if self.item is None:
+            self.item = self.namespace.GetItemFromID(self.entry_id, self.store_id)
+        return self.item
 
 class OnlineArchiveSorter:
     CONFIG_FILE_NAME = 'config_archive_v02.json'
     MAIL_ITEM_CLASS = 43 
+    PROGRESS_INTERVAL = 30  # seconds between progress reports
+    BATCH_SIZE = 100  # items held open at once, stays under Exchange's open-item limit
+
+    SUB_INBOXES = ["Inbox\\Inbox1", "Inbox\\Inbox2", "Inbox\\Inbox3", "Inbox\\Inbox4"]
+    ALL_SUB_INBOXES = "All sub-inboxes (parallel)"
+
+    # DASL properties used to prefilter items on the server with Items.Restrict
+    DASL_SENDER = "urn:schemas:httpmail:fromemail"
+    DASL_SENDER_SMTP = "http://schemas.microsoft.com/mapi/proptag/0x5D01001F"  # PR_SENDER_SMTP_ADDRESS
+    DASL_SENDER_TYPE = "http://schemas.microsoft.com/mapi/proptag/0x0C1E001F"  # PR_SENDER_ADDRTYPE
+    DASL_SUBJECT = "urn:schemas:httpmail:subject"
+    DASL_BODY = "urn:schemas:httpmail:textdescription"
+    DASL_MAX_CLAUSES = 50  # OR clauses per Restrict, keeps each query within Exchange limits
+
+    # Folder table columns read per row instead of opening every MailItem
+    TABLE_COLUMNS = ("EntryID", "Subject", "MessageClass", "SenderEmailType", "SenderEmailAddress",
+                     DASL_SENDER_SMTP)
 
     def __init__(self):
         self.config = self._load_config()
         self.setup_paths()
         self.setup_logging()
         
-        # Load interval from config, default to 500
-        self.cache_save_interval = self.config.get("cache_save_interval", 500)
+        # Misses are written through to sqlite, so the cache is never held or saved in full
+        self.smtp_db = self._open_smtp_db()
         
         self.email_rules = {}
         self.keyword_rules = {}
-        self.smtp_cache = {}
+        self._subject_index = None
+        self._body_index = None
+        # Keyword rules column by column, indexed by load order
+        self._kw_list = []
+        self._dest_list = []
+        self._body_mask = []
+        # (index, keyword) pairs of the non-empty keywords each text is checked against
+        self._subject_rules = []
+        self._body_rules = []
+        self._has_body_rule = False
+        self._first_body_idx = None
+        self._server_filters = []
         self.processed_count = 0
-        self.items_since_last_save = 0
+        # COM objects belong to the thread that created them, see namespace/_folder_cache
+        self._local = threading.local()
+        # Guards processed_count and smtp_db when sub-inboxes run in parallel
+        self._lock = threading.Lock()
         
         self.load_data()
+        # Rules do not change for the rest of the run, specialize the matcher for them
+        self._match_fn = self._compile_match_fn()
+
+    @property
+    def namespace(self):
+        """Outlook MAPI namespace of the current thread."""
+        return getattr(self._local, 'namespace', None)
+
+    @namespace.setter
+    def namespace(self, value):
+        self._local.namespace = value
+
+    @property
+    def _folder_cache(self):
+        """(parent EntryID, name) -> (folder, folder EntryID) of the current thread."""
+        if not hasattr(self._local, 'folder_cache'):
+            self._local.folder_cache = {}
+        return self._local.folder_cache
 
     def _load_config(self):
         if not os.path.exists(self.CONFIG_FILE_NAME):
@@ -54,6 +131,25 @@ class OnlineArchiveSorter:
     def setup_paths(self):
         self.xls_path = self.config.get('xls_path')
         self.archive_name = self.config.get('archive_folder_name')
+        # The Excel export of the SMTP cache lives next to the rules file
+        rules_dir = os.path.dirname(self.xls_path or '')
+        # The sqlite store stays on a local disk, its -wal/-shm files break in a synced folder
+        local_dir = os.path.join(os.environ.get('LOCALAPPDATA') or os.path.expanduser('~'),
+                                 'OnlineArchiveSorter')
+        self.smtp_db_path = self.config.get('smtp_db_path') or os.path.join(local_dir, 'smtp_cache.db')
+        self.smtp_cache_path = self.config.get('smtp_cache_path') or os.path.join(rules_dir, 'smtp_cache.xlsx')
+
+    def _open_smtp_db(self):
+        """Opens the SMTP cache store once; WAL keeps single-row inserts cheap."""
+        db_dir = os.path.dirname(self.smtp_db_path)
+        if db_dir and not os.path.exists(db_dir):
+            os.makedirs(db_dir)
+        conn = sqlite3.connect(self.smtp_db_path, check_same_thread=False, isolation_level=None)
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute("PRAGMA synchronous=NORMAL")
+        conn.execute("CREATE TABLE IF NOT EXISTS smtp_cache "
+                     "(exchange_address TEXT PRIMARY KEY, smtp_address TEXT)")
+        return conn
 
     def setup_logging(self):
         # Create loggers with UTF-8 encoding
@@ -98,10 +194,14 @@ class OnlineArchiveSorter:
     def load_data(self):
         """Loads all 11 rules from Excel as per v38.11 logic."""
         try:
-            with pd.ExcelFile(self.xls_path) as xls:
+            # calamine parses only the sheets that are read, much faster than openpyxl
+            with pd.ExcelFile(self.xls_path, engine='calamine') as xls:
                 sheet_map = self.config.get('sheet_map', {})
                 
                 for rule_name, info in sheet_map.items():
+                    # Entries such as SMTPResolutionCache name a sheet but hold no rule
+                    if not info.get('destination_name'):
+                        continue
                     df = pd.read_excel(xls, info['sheet'])
                     dest = info['destination_name']
                     
@@ -112,7 +212,7 @@ class OnlineArchiveSorter:
                         for addr in addresses:
                             # Rule 8 specific: ResearchEmail is sender only
                             is_sender_only = (rule_name == "ResearchEmail")
-                            self.email_rules[addr.lower()] = {"dest": dest, "sender_only": is_sender_only}
+                            self.email_rules[sys.intern(str(addr).casefold())] = {"dest": dest, "sender_only": is_sender_only}
                     
                     # Logic for Keyword rules
                     else:
@@ -121,38 +221,202 @@ class OnlineArchiveSorter:
                         for col in cols:
                             keywords = df[col].dropna().unique().tolist()
                             for kw in keywords:
-                                self.keyword_rules[str(kw).lower()] = {"dest": dest, "field": match_field}
+                                # Case-fold and intern once here, never per email
+                                # The sheet text is kept for the server-side filter
+                                self.keyword_rules[sys.intern(str(kw).casefold())] = {
+                                    "dest": dest, "field": match_field, "text": str(kw)}
 
-                # Load SMTP Cache
-                try:
-                    cache_df = pd.read_excel(xls, 'SMTP_Cache')
-                    self.smtp_cache = dict(zip(cache_df['ExchangeAddress'].str.lower(), cache_df['SMTPAddress']))
-                except:
-                    self.smtp_cache = {}
+                # SMTP Cache stays on disk and is queried per lookup
+                if self.smtp_db.execute("SELECT 1 FROM smtp_cache LIMIT 1").fetchone() is None:
+                    # First run on the sqlite store: import the Excel cache of older versions
+                    try:
+                        if os.path.exists(self.smtp_cache_path):
+                            cache_df = pd.read_excel(self.smtp_cache_path, 'SMTP_Cache', engine='calamine')
+                        else:
+                            cache_df = pd.read_excel(xls, 'SMTP_Cache')
+                        # One transaction for the whole import, not one per row
+                        self.smtp_db.execute("BEGIN")
+                        try:
+                            self.smtp_db.executemany(
+                                "INSERT OR IGNORE INTO smtp_cache VALUES (?, ?)",
+                                zip(cache_df['ExchangeAddress'].str.casefold(), cache_df['SMTPAddress']))
+                            self.smtp_db.execute("COMMIT")
+                        except:
+                            self.smtp_db.execute("ROLLBACK")
+                            raise
+                    except:
+                        pass
         except Exception as e:
             self.invalid_logger.critical(f"DataLoaderError||{e}")
+        finally:
+            # Rules loaded before an error still apply, as they did before
+            self._build_keyword_matchers()
+            self._server_filters = self._build_server_filters()
+
+    def _build_keyword_matchers(self):
+        """Compiles keyword rules into keyword indexes so each text is scanned once."""
+        self._kw_list = list(self.keyword_rules)
+        self._dest_list = [r['dest'] for r in self.keyword_rules.values()]
+        self._body_mask = [r['field'] == 'subject_and_body' for r in self.keyword_rules.values()]
+        # Only the rule index is kept; the lowest index is the first loaded rule and wins
+        # Every keyword can match the subject; only subject_and_body ones the body
+        self._subject_rules = [(idx, kw) for idx, kw in enumerate(self._kw_list) if kw]
+        self._body_rules = [(idx, kw) for idx, kw in self._subject_rules if self._body_mask[idx]]
+        self._subject_index = self._build_keyword_index(self._subject_rules)
+        self._body_index = self._build_keyword_index(self._body_rules)
+        if ahocorasick is None and self._subject_rules:
+            if re2 is not None:
+                self.invalid_logger.warning("MatcherFallback||pyahocorasick not installed, using RE2 sets")
+            else:
+                self.invalid_logger.warning("MatcherFallback||pyahocorasick and google-re2 not installed, "
+                                            "keyword rules are checked one by one")
+        # item.Body is an expensive MAPI read, only fetch it when a rule can use it
+        self._has_body_rule = bool(self._body_rules)
+        # A subject hit only skips the body when no body rule comes before it
+        self._first_body_idx = self._body_rules[0][0] if self._has_body_rule else None
+
+    def _build_keyword_index(self, rules):
+        """
+        Indexes (rule index, keyword) pairs so one pass over a text reports every keyword
+        found: an Aho-Corasick automaton, else an RE2 set. None if there are no rules or
+        neither package is installed, the keywords are then checked one by one.
+        """
+        if not rules:
+            return None
+        if ahocorasick is not None:
+            automaton = ahocorasick.Automaton()
+            for idx, kw in rules:
+                automaton.add_word(kw, idx)
+            automaton.make_automaton()
+            return automaton
+        if re2 is not None:
+            # Set entries are numbered in insertion order, i.e. positions in rules
+            keyword_set = re2.Set.SearchSet()
+            for _, kw in rules:
+                keyword_set.Add(re2.escape(kw))
+            keyword_set.Compile()
+            return keyword_set
+        return None
 
-    def save_smtp_cache(self):
-        """Saves cache back to Excel. Critical for Archive due to volume."""
+    def _compile_match_fn(self):
+        """
+        Generates match(sender_email, subject, get_body) -> (dest, trigger, match_type) or None
+        for the loaded rules. Branches for rule kinds that are not loaded are left out and
+        the rule tables are bound as globals of the generated function.
+        """
+        namespace = {
+            # Rule 8 Logic: an empty sender never matches a sender_only rule
+            "EMAIL_DESTS": {addr: r['dest'] for addr, r in self.email_rules.items()
+                            if addr or not r.get("sender_only")},
+            "SUBJECT_INDEX": self._subject_index,
+            "BODY_INDEX": self._body_index,
+            "SUBJECT_RULES": self._subject_rules,
+            "BODY_RULES": self._body_rules,
+            "DESTS": self._dest_list,
+            "KEYWORDS": self._kw_list,
+            "FIRST_BODY_IDX": self._first_body_idx,
+        }
+        lines = ["def match(sender_email, subject, get_body):"]
+        if namespace["EMAIL_DESTS"]:
+            lines += ["    # 1. Check Email Rules",
+                      "    dest = EMAIL_DESTS.get(sender_email)",
+                      "    if dest is not None:",
+                      "        return dest, sender_email, 'EmailMatch'"]
+        # Each expression yields the lowest matching rule index, i.e. the first loaded rule
+        if ahocorasick is not None:
+            # Automata values are rule indices
+            find = "min((i for _, i in {index}.iter({text})), default=None)"
+        elif re2 is not None:
+            # Match() returns the set positions of all keywords found, or None
+            find = "min(({rules}[p][0] for p in {index}.Match({text}) or ()), default=None)"
+        else:
+            # Rules are tried in load order, so the first hit is the lowest index
+            find = "next((i for i, kw in {rules} if kw in {text}), None)"
+        find_subject = find.format(index="SUBJECT_INDEX", rules="SUBJECT_RULES", text="subject")
+        find_body = find.format(index="BODY_INDEX", rules="BODY_RULES", text="body")
+        if self._subject_rules:
+            lines += ["    # 2. Check Keyword Rules",
+                      f"    idx = {find_subject}"]
+        else:
+            lines += ["    idx = None"]
+        if self._has_body_rule:
+            lines += ["    # 3. Body is only read when a body rule could still beat the subject hit",
+                      "    if idx is None or FIRST_BODY_IDX < idx:",
+                      "        body = get_body()",
+                      f"        body_idx = {find_body}",
+                      "        if body_idx is not None and (idx is None or body_idx < idx):",
+                      "            idx = body_idx"]
+        lines += ["    if idx is None:",
+                  "        return None",
+                  "    return DESTS[idx], KEYWORDS[idx], 'KeywordMatch'"]
+        exec(compile("\n".join(lines), "<rule_matcher>", "exec"), namespace)
+        return namespace["match"]
+
+    def _build_server_filters(self):
+        """Builds DASL filters so Exchange only returns items some rule could match."""
+        clauses = []
+        # Body clauses get their own filters, a folder Table cannot restrict on the body
+        body_clauses = []
+        for addr in self.email_rules:
+            value = self._dasl_quote(addr)
+            # Exchange senders only expose their SMTP address through PR_SENDER_SMTP_ADDRESS
+            clauses.append(f'"{self.DASL_SENDER}" = {value}')
+            clauses.append(f'"{self.DASL_SENDER_SMTP}" = {value}')
+        if self.email_rules:
+            # Exchange senders without that property are resolved client-side (GetExchangeUser
+            # and the SMTP cache), so they stay candidates for the email rules
+            clauses.append(f'("{self.DASL_SENDER_TYPE}" = \'EX\' AND "{self.DASL_SENDER_SMTP}" IS NULL)')
+        for kw, info in self.keyword_rules.items():
+            # casefold() may have rewritten the sheet text (e.g. "ß" -> "ss"), so both
+            # spellings are sent and Exchange's case-insensitive LIKE sees the original
+            original = info['text']
+            for text in ([original] if original.lower() == kw else [original, kw]):
+                value = self._dasl_quote(f"%{text}%")
+                clauses.append(f'"{self.DASL_SUBJECT}" LIKE {value}')
+                if info['field'] == 'subject_and_body':
+                    body_clauses.append(f'"{self.DASL_BODY}" LIKE {value}')
+        size = self.DASL_MAX_CLAUSES
+        return ["@SQL=" + " OR ".join(group[i:i + size])
+                for group in (clauses, body_clauses) for i in range(0, len(group), size)]
+
+    def _dasl_quote(self, value):
+        """Quotes a string literal for a DASL query."""
+        return "'" + str(value).replace("'", "''") + "'"
+
+    def export_smtp_cache(self):
+        """Exports the cache to Excel once per run so it can be reviewed by hand."""
         try:
-            df = pd.DataFrame(list(self.smtp_cache.items()), columns=['ExchangeAddress', 'SMTPAddress'])
-            with pd.ExcelWriter(self.xls_path, engine='openpyxl', mode='a', if_sheet_exists='replace') as writer:
-                df.to_excel(writer, sheet_name='SMTP_Cache', index=False)
-            self.items_since_last_save = 0
+            # Streams rows straight to disk instead of rewriting the rules workbook
+            workbook = xlsxwriter.Workbook(self.smtp_cache_path, {'constant_memory': True})
+            sheet = workbook.add_worksheet('SMTP_Cache')
+            sheet.write_row(0, 0, ['ExchangeAddress', 'SMTPAddress'])
+            rows = self.smtp_db.execute("SELECT exchange_address, smtp_address FROM smtp_cache")
+            for row, pair in enumerate(rows, start=1):
+                sheet.write_row(row, 0, pair)
+            workbook.close()
         except Exception as e:
-            self.invalid_logger.error(f"CacheSaveError||{e}")
+            self.invalid_logger.error(f"CacheExportError||{e}")
+
+    def _cached_smtp_address(self, ex_addr):
+        """Looks up a resolved Exchange address in the SMTP cache store."""
+        with self._lock:
+            row = self.smtp_db.execute(
+                "SELECT smtp_address FROM smtp_cache WHERE exchange_address = ?", (ex_addr,)).fetchone()
+        return row[0] if row else None
 
     def get_smtp_address(self, item):
         try:
             sender_obj = item.Sender
             if sender_obj.AddressEntryUserType == 0: # olExchangeUserAddressEntry
-                ex_addr = sender_obj.Address.lower()
-                if ex_addr in self.smtp_cache:
-                    return self.smtp_cache[ex_addr]
+                ex_addr = sender_obj.Address.casefold()
+                smtp = self._cached_smtp_address(ex_addr)
+                if smtp:
+                    return smtp
                 eu = sender_obj.GetExchangeUser()
                 if eu:
                     smtp = eu.PrimarySmtpAddress
-                    self.smtp_cache[ex_addr] = smtp
+                    with self._lock:
+                        self.smtp_db.execute("INSERT OR IGNORE INTO smtp_cache VALUES (?, ?)", (ex_addr, smtp))
                     return smtp
             return item.SenderEmailAddress
         except:
@@ -161,61 +425,79 @@ class OnlineArchiveSorter:
     def get_folder_recursive(self, root_folder, folder_path):
         """Finds or creates folders within the Archive root."""
         current_node = root_folder
+        current_id = root_folder.EntryID
         parts = folder_path.split('\\')
         for part in parts:
+            key = (current_id, part)
+            if key in self._folder_cache:
+                current_node, current_id = self._folder_cache[key]
+                continue
             try:
                 current_node = current_node.Folders.Item(part)
             except:
-                current_node = current_node.Folders.Add(part)
+                try:
+                    current_node = current_node.Folders.Add(part)
+                except:
+                    # Another sub-inbox worker created it in the meantime
+                    current_node = current_node.Folders.Item(part)
+            current_id = current_node.EntryID
+            self._folder_cache[key] = (current_node, current_id)
         return current_node
 
-    def process_email(self, item, archive_root):
-        """Determines if email should be deleted or moved based on 11 rules."""
-        try:
-            subject = str(item.Subject).lower()
-            body = str(item.Body).lower()
-            sender_email = (self.get_smtp_address(item) or "").lower()
-            
-            # 1. Check Email Rules
-            if sender_email in self.email_rules:
-                rule_info = self.email_rules[sender_email]
-                # Rule 8 Logic: Check if sender_only is required
-                if not rule_info.get("sender_only") or sender_email: 
-                    return self.execute_action(item, rule_info['dest'], archive_root, sender_email, "EmailMatch")
-
-            # 2. Check Keyword Rules
-            for kw, info in self.keyword_rules.items():
-                match = False
-                if info['field'] == 'subject_only' and kw in subject:
-                    match = True
-                elif info['field'] == 'subject_and_body' and (kw in subject or kw in body):
-                    match = True
-                
-                if match:
-                    return self.execute_action(item, info['dest'], archive_root, kw, "KeywordMatch")
-            
-            return False
-        except Exception as e:
-            self.invalid_logger.error(f"ItemProcessError||{e}")
-            return False
+    def read_row(self, item, entry_id):
+        """Reads the fields rules match on: (LazyItem, sender_email, subject)."""
+        sender_email = (self.get_smtp_address(item) or "").casefold()
+        subject = str(item.Subject).casefold()
+        return LazyItem(entry_id, item=item), sender_email, subject
+
+    def read_table_row(self, values, store_id):
+        """Same as read_row, from TABLE_COLUMNS values; None if the row is not a mail item."""
+        entry_id, subject, message_class, sender_type, sender_address, sender_smtp = values
+        # MessageClass case varies between clients (e.g. "IPM.NOTE"), Class == 43 ignored it
+        if not str(message_class or "").upper().startswith("IPM.NOTE"):
+            return None
+        lazy = LazyItem(entry_id, store_id, self.namespace)
+        if sender_smtp:
+            sender_email = sender_smtp
+        elif sender_type == "EX":
+            # Unresolved Exchange senders still need the full item
+            sender_email = self._cached_smtp_address(str(sender_address).casefold()) or \
+                self.get_smtp_address(lazy.get())
+        else:
+            sender_email = sender_address
+        return lazy, (sender_email or "").casefold(), str(subject or "").casefold()
+
+    def match_batch(self, rows):
+        """Matches rows from read_row; returns one (dest, trigger, match_type) or None per row."""
+        match = self._match_fn
+        matches = []
+        for lazy, sender_email, subject in rows:
+            try:
+                matches.append(match(sender_email, subject, lambda: str(lazy.get().Body).casefold()))
+            except Exception as e:
+                self.invalid_logger.error(f"ItemProcessError||{e}")
+                matches.append(None)
+        return matches
 
     def execute_action(self, item, dest_name, archive_root, trigger, match_type):
         """Performs Delete or Move."""
         try:
+            # Read once, before the item is gone
+            subject = str(item.Subject)
             if dest_name == "ToDelete":
                 item.Delete()
                 # Use safe logging for console output
-                safe_subject = self._safe_string(str(item.Subject))
+                safe_subject = self._safe_string(subject)
                 print(f"DELETED|{trigger}|{match_type}|{safe_subject}")
-                self.bulk_logger.info(f"DELETED|{trigger}|{match_type}|{item.Subject}")
+                self.bulk_logger.info("DELETED|%s|%s|%s", trigger, match_type, subject)
                 return True
             else:
                 dest_folder = self.get_folder_recursive(archive_root, dest_name)
                 item.Move(dest_folder)
                 # Use safe logging for console output
-                safe_subject = self._safe_string(str(item.Subject))
+                safe_subject = self._safe_string(subject)
                 print(f"MOVED|{dest_name}|{trigger}|{match_type}|{safe_subject}")
-                self.bulk_logger.info(f"MOVED|{dest_name}|{trigger}|{match_type}|{item.Subject}")
+                self.bulk_logger.info("MOVED|%s|%s|%s|%s", dest_name, trigger, match_type, subject)
                 return True
         except Exception as e:
             self.invalid_logger.error(f"ActionError|{dest_name}|{e}")
@@ -232,110 +514,240 @@ class OnlineArchiveSorter:
     def run_archive_processing(self, target_folder_path):
         pythoncom.CoInitialize()
         try:
-            print(f"[{datetime.datetime.now().strftime('%H:%M:%S')}] Connecting to Outlook...")
-            outlook = win32com.client.Dispatch("Outlook.Application").GetNamespace("MAPI")
-            archive_root = None
-            
-            print(f"[{datetime.datetime.now().strftime('%H:%M:%S')}] Looking for archive: {self.archive_name}")
-            for store in outlook.Stores:
-                if store.DisplayName == self.archive_name:
-                    archive_root = store.GetRootFolder()
-                    break
-            
+            if self._process_folder_path(target_folder_path):
+                self._finish_run()
+        except Exception as e:
+            self.invalid_logger.critical(f"GlobalRunError||{e}")
+            print(f"[{datetime.datetime.now().strftime('%H:%M:%S')}] ERROR: {e}")
+        finally:
+            pythoncom.CoUninitialize()
+
+    def run_parallel_processing(self, folder_paths):
+        """Processes several sub-inboxes at once, one worker thread per folder."""
+        pythoncom.CoInitialize()
+        try:
+            # The archive store is looked up once, workers reopen its root folder by ID
+            archive_root = self._find_archive_root(self._connect())
             if not archive_root:
                 messagebox.showerror("Error", f"Could not find archive: {self.archive_name}")
                 print(f"[{datetime.datetime.now().strftime('%H:%M:%S')}] ERROR: Archive not found!")
                 return
+            root_ids = (archive_root.EntryID, archive_root.StoreID)
 
-            print(f"[{datetime.datetime.now().strftime('%H:%M:%S')}] Archive found. Resolving folder: {target_folder_path}")
-            
-            # Resolve the specific folder selected by user
-            target_folder = archive_root
-            if target_folder_path != "ROOT":
-                parts = target_folder_path.split('\\')
-                for i, part in enumerate(parts):
-                    try:
-                        print(f"[{datetime.datetime.now().strftime('%H:%M:%S')}] Looking for folder: '{part}' under '{target_folder.Name}'")
-                        
-                        # List available folders for debugging
-                        folder_names = []
-                        for f in target_folder.Folders:
-                            folder_names.append(f.Name)
-                        print(f"[{datetime.datetime.now().strftime('%H:%M:%S')}] Available folders: {folder_names}")
-                        
-                        target_folder = target_folder.Folders.Item(part)
-                        print(f"[{datetime.datetime.now().strftime('%H:%M:%S')}] Successfully found: '{part}'")
-                        
-                    except Exception as e:
-                        error_msg = f"Cannot find folder '{part}' under '{target_folder.Name}'\n\n"
-                        error_msg += f"Available folders under '{target_folder.Name}':\n"
-                        for f in target_folder.Folders:
-                            error_msg += f"  - {f.Name}\n"
-                        error_msg += f"\nFull path attempted: {target_folder_path}\n"
-                        error_msg += f"Error: {e}"
-                        
-                        messagebox.showerror("Folder Not Found", error_msg)
-                        print(f"[{datetime.datetime.now().strftime('%H:%M:%S')}] ERROR: {error_msg}")
-                        return
-            
-            print(f"[{datetime.datetime.now().strftime('%H:%M:%S')}] Target folder: {target_folder.FolderPath}")
-            print(f"[{datetime.datetime.now().strftime('%H:%M:%S')}] Starting processing...")
-            
-            self.bulk_logger.info(f"STARTING|Folder: {target_folder.FolderPath}")
-            
-            self._process_folder_items(target_folder, archive_root)
-            
-            print(f"[{datetime.datetime.now().strftime('%H:%M:%S')}] Saving SMTP cache...")
-            self.save_smtp_cache() # Final save
-            
-            print(f"[{datetime.datetime.now().strftime('%H:%M:%S')}] Processing complete!")
-            print(f"[{datetime.datetime.now().strftime('%H:%M:%S')}] Total items processed: {self.processed_count}")
-            
-            messagebox.showinfo("Done", f"Processing complete.\nProcessed: {self.processed_count} items.")
-            
+            # All workers share one Outlook session and its open-item limit
+            self.BATCH_SIZE = max(1, type(self).BATCH_SIZE // len(folder_paths))
+            # Matching is cheap, the time goes into COM round-trips that can overlap
+            with ThreadPoolExecutor(max_workers=len(folder_paths)) as executor:
+                results = list(executor.map(self._run_one_folder, folder_paths, [root_ids] * len(folder_paths)))
+
+            # Tk dialogs are only shown from here, never from the worker threads
+            errors = [error for _, error in results if error]
+            if errors:
+                messagebox.showerror("Error", "\n\n".join(errors))
+            if any(done for done, _ in results):
+                self._finish_run()
         except Exception as e:
             self.invalid_logger.critical(f"GlobalRunError||{e}")
             print(f"[{datetime.datetime.now().strftime('%H:%M:%S')}] ERROR: {e}")
         finally:
             pythoncom.CoUninitialize()
 
-    def _process_folder_items(self, folder, archive_root):
-        """Iterates backwards to ensure stability during moves/deletes."""
+    def _run_one_folder(self, target_folder_path, root_ids):
+        """
+        Worker for run_parallel_processing, with its own COM apartment and Outlook connection.
+        Returns (done, error_msg) so the caller can report errors.
+        """
+        pythoncom.CoInitialize()
         try:
-            items = folder.Items
-            
-            print(f"[{datetime.datetime.now().strftime('%H:%M:%S')}] Processing items...")
-            
-            # Initialize progress tracking
-            last_progress_time = time.time()
-            items_processed_since_last_update = 0
-            
-            # We'll process without knowing the total count
-            i = items.Count
-            while i > 0:
+            archive_root = self._connect().GetFolderFromID(*root_ids)
+            target_folder, error_msg = self._resolve_target_folder(archive_root, target_folder_path)
+            if target_folder is None:
+                return False, error_msg
+            self._process_target_folder(target_folder, archive_root)
+            return True, None
+        except Exception as e:
+            self.invalid_logger.critical(f"GlobalRunError|{target_folder_path}|{e}")
+            print(f"[{datetime.datetime.now().strftime('%H:%M:%S')}] ERROR in {target_folder_path}: {e}")
+            return False, f"Error in {target_folder_path}: {e}"
+        finally:
+            pythoncom.CoUninitialize()
+
+    def _process_folder_path(self, target_folder_path):
+        """Connects to Outlook, resolves the folder and processes it; False if it cannot be found."""
+        archive_root = self._find_archive_root(self._connect())
+        if not archive_root:
+            messagebox.showerror("Error", f"Could not find archive: {self.archive_name}")
+            print(f"[{datetime.datetime.now().strftime('%H:%M:%S')}] ERROR: Archive not found!")
+            return False
+
+        target_folder, error_msg = self._resolve_target_folder(archive_root, target_folder_path)
+        if target_folder is None:
+            messagebox.showerror("Folder Not Found", error_msg)
+            return False
+
+        self._process_target_folder(target_folder, archive_root)
+        return True
+
+    def _connect(self):
+        """Opens this thread's Outlook MAPI namespace."""
+        print(f"[{datetime.datetime.now().strftime('%H:%M:%S')}] Connecting to Outlook...")
+        outlook = win32com.client.Dispatch("Outlook.Application").GetNamespace("MAPI")
+        # Used to open matched items from folder table rows
+        self.namespace = outlook
+        return outlook
+
+    def _find_archive_root(self, outlook):
+        """Returns the root folder of the archive store, or None if it is not mounted."""
+        print(f"[{datetime.datetime.now().strftime('%H:%M:%S')}] Looking for archive: {self.archive_name}")
+        for store in outlook.Stores:
+            if store.DisplayName == self.archive_name:
+                print(f"[{datetime.datetime.now().strftime('%H:%M:%S')}] Archive found.")
+                return store.GetRootFolder()
+        return None
+
+    def _resolve_target_folder(self, archive_root, target_folder_path):
+        """Returns (folder, None), or (None, error_msg) if part of the path does not exist."""
+        print(f"[{datetime.datetime.now().strftime('%H:%M:%S')}] Resolving folder: {target_folder_path}")
+
+        # Resolve the specific folder selected by user
+        target_folder = archive_root
+        if target_folder_path != "ROOT":
+            parts = target_folder_path.split('\\')
+            for i, part in enumerate(parts):
+                try:
+                    print(f"[{datetime.datetime.now().strftime('%H:%M:%S')}] Looking for folder: '{part}' under '{target_folder.Name}'")
+                    
+                    # List available folders for debugging
+                    folder_names = []
+                    for f in target_folder.Folders:
+                        folder_names.append(f.Name)
+                    print(f"[{datetime.datetime.now().strftime('%H:%M:%S')}] Available folders: {folder_names}")
+                    
+                    target_folder = target_folder.Folders.Item(part)
+                    print(f"[{datetime.datetime.now().strftime('%H:%M:%S')}] Successfully found: '{part}'")
+                    
+                except Exception as e:
+                    error_msg = f"Cannot find folder '{part}' under '{target_folder.Name}'\n\n"
+                    error_msg += f"Available folders under '{target_folder.Name}':\n"
+                    for f in target_folder.Folders:
+                        error_msg += f"  - {f.Name}\n"
+                    error_msg += f"\nFull path attempted: {target_folder_path}\n"
+                    error_msg += f"Error: {e}"
+                    
+                    print(f"[{datetime.datetime.now().strftime('%H:%M:%S')}] ERROR: {error_msg}")
+                    return None, error_msg
+        return target_folder, None
+
+    def _process_target_folder(self, target_folder, archive_root):
+        """Processes one resolved folder, moving matches into archive_root."""
+        print(f"[{datetime.datetime.now().strftime('%H:%M:%S')}] Target folder: {target_folder.FolderPath}")
+        print(f"[{datetime.datetime.now().strftime('%H:%M:%S')}] Starting processing...")
+        
+        self.bulk_logger.info(f"STARTING|Folder: {target_folder.FolderPath}")
+        
+        self._process_folder_items(target_folder, archive_root)
+
+    def _finish_run(self):
+        """Exports the SMTP cache and reports the totals once all folders are done."""
+        print(f"[{datetime.datetime.now().strftime('%H:%M:%S')}] Exporting SMTP cache...")
+        self.export_smtp_cache()
+        
+        print(f"[{datetime.datetime.now().strftime('%H:%M:%S')}] Processing complete!")
+        print(f"[{datetime.datetime.now().strftime('%H:%M:%S')}] Total items processed: {self.processed_count}")
+        
+        messagebox.showinfo("Done", f"Processing complete.\nProcessed: {self.processed_count} items.")
+
+    def _candidate_batches(self, folder, checked):
+        """Yields row batches to match: one source per filter, or the whole folder."""
+        filters = self._server_filters if self.config.get('use_server_filter', True) else []
+        for dasl in filters or [None]:
+            try:
+                if dasl and self.DASL_BODY in dasl:
+                    batches = self._item_batches(folder.Items.Restrict(dasl), checked)
+                else:
+                    batches = self._table_batches(self._open_table(folder, dasl), folder.StoreID, checked)
+                yield from batches
+            except Exception as e:
+                # Fall back to a full scan rather than silently skip rules
+                self.invalid_logger.error(f"RestrictError|{folder.Name}|{e}")
+                yield from self._item_batches(folder.Items, checked)
+                return
+
+    def _open_table(self, folder, dasl):
+        """Opens the folder Table projected onto TABLE_COLUMNS."""
+        table = folder.GetTable(dasl or "")
+        table.Columns.RemoveAll()
+        for column in self.TABLE_COLUMNS:
+            table.Columns.Add(column)
+        return table
+
+    def _table_batches(self, table, store_id, checked):
+        """Reads rows from a folder Table; MailItems are only opened for matches and body rules."""
+        while not table.EndOfTable:
+            rows = []
+            for values in table.GetArray(self.BATCH_SIZE) or ():
+                try:
+                    if values[0] not in checked:
+                        row = self.read_table_row(values, store_id)
+                        if row:
+                            rows.append(row)
+                except Exception as e:
+                    self.invalid_logger.error(f"ItemProcessError||{e}")
+            yield rows
+
+    def _item_batches(self, items, checked):
+        """Reads rows from an Items collection, backwards to stay stable during moves/deletes."""
+        # We'll process without knowing the total count
+        i = items.Count
+        while i > 0:
+            # Only items at or above the current index are moved while a batch is out,
+            # so the lower indices of the next batch stay valid
+            rows = []
+            while i > 0 and len(rows) < self.BATCH_SIZE:
                 try:
                     item = items.Item(i)
                     if item.Class == self.MAIL_ITEM_CLASS:
-                        if self.process_email(item, archive_root):
-                            self.processed_count += 1
-                            self.items_since_last_save += 1
-                            items_processed_since_last_update += 1
-                            
-                            # Show progress every 100 items or every 30 seconds
-                            current_time = time.time()
-                            if items_processed_since_last_update >= 100 or (current_time - last_progress_time) >= 30:
-                                print(f"[{datetime.datetime.now().strftime('%H:%M:%S')}] Progress: {self.processed_count} items processed")
-                                items_processed_since_last_update = 0
-                                last_progress_time = current_time
-                            
-                            if self.items_since_last_save >= self.cache_save_interval:
-                                print(f"[{datetime.datetime.now().strftime('%H:%M:%S')}] Saving SMTP cache (interval reached)...")
-                                self.save_smtp_cache()
-                    i -= 1
+                        entry_id = item.EntryID
+                        if entry_id not in checked:
+                            rows.append(self.read_row(item, entry_id))
                 except Exception as e:
                     # Likely item moved/deleted or COM error - continue with next item
-                    i -= 1
-                    continue
+                    pass
+                i -= 1
+            yield rows
+
+    def _process_folder_items(self, folder, archive_root):
+        """Matches the folder batch by batch and moves/deletes the matched items."""
+        try:
+            print(f"[{datetime.datetime.now().strftime('%H:%M:%S')}] Processing items...")
+            
+            # Initialize progress tracking
+            last_progress_time = time.monotonic()
+            
+            # Items returned by several filters but matching no rule are only checked once
+            checked = set()
+            
+            # 1. Read a batch of rows, 2. match the whole batch, 3. act only on the matched rows
+            for rows in self._candidate_batches(folder, checked):
+                for row, match in zip(rows, self.match_batch(rows)):
+                    lazy = row[0]
+                    if match is None:
+                        checked.add(lazy.entry_id)
+                        continue
+                    try:
+                        dest_name, trigger, match_type = match
+                        if self.execute_action(lazy.get(), dest_name, archive_root, trigger, match_type):
+                            with self._lock:
+                                self.processed_count += 1
+                    except Exception as e:
+                        self.invalid_logger.error(f"ItemProcessError||{e}")
+                
+                # Show progress at most every PROGRESS_INTERVAL seconds
+                current_time = time.monotonic()
+                if current_time - last_progress_time >= self.PROGRESS_INTERVAL:
+                    print(f"[{time.strftime('%H:%M:%S')}] Progress: {self.processed_count} items processed")
+                    self.bulk_logger.info("PROGRESS|%d items processed", self.processed_count)
+                    last_progress_time = current_time
                     
             print(f"[{datetime.datetime.now().strftime('%H:%M:%S')}] Folder processing complete")
         except Exception as e:
@@ -345,19 +757,12 @@ class OnlineArchiveSorter:
     def start_gui(self):
         root = tk.Tk()
         root.title(f"Online Archive Sorter v02.01")
-        root.geometry("450x400")
+        root.geometry("450x430")
 
         tk.Label(root, text="Select Folder to Process:", font=("Arial", 12, "bold")).pack(pady=10)
 
         # Folder selection list - HARDCODED
-        folders = [
-            "ROOT",
-            "Inbox",
-            "Inbox\\Inbox1",
-            "Inbox\\Inbox2",
-            "Inbox\\Inbox3",
-            "Inbox\\Inbox4"
-        ]
+        folders = ["ROOT", "Inbox"] + self.SUB_INBOXES + [self.ALL_SUB_INBOXES]
         
         selected_folder = tk.StringVar(value="Inbox")
         for f in folders:
@@ -369,7 +774,11 @@ class OnlineArchiveSorter:
                 btn_start.config(state=tk.DISABLED)
                 # Close the dialog box
                 root.destroy()
-                threading.Thread(target=lambda: self.run_archive_processing(folder_to_process), daemon=True).start()
+                if folder_to_process == self.ALL_SUB_INBOXES:
+                    target = lambda: self.run_parallel_processing(self.SUB_INBOXES)
+                else:
+                    target = lambda: self.run_archive_processing(folder_to_process)
+                threading.Thread(target=target, daemon=True).start()
 
         btn_start = tk.Button(root, text="Start Processing", command=start_task, 
                               bg="#28a745", fg="white", font=("Arial", 11, "bold"), height=2, width=20)